@@ -0,0 +1,111 @@
+import sys
+import time
+import pickle
+import cv2
+import numpy as np
+from deepface import DeepFace
+from roi import AdaptiveResolution, detect_faces_roi, load_regions
+from templates import build_templates, nearest
+
+# Compara o caminho antigo (frame inteiro em 640x480) com a detecção por ROI
+# em resolução adaptativa. Uso: python benchmark_roi.py video.mp4 [embeddings.pkl]
+video_path = sys.argv[1] if len(sys.argv) > 1 else 0
+embeddings_file = sys.argv[2] if len(sys.argv) > 2 else './dataset/authorized_embeddings.pkl'
+threshold = 0.57
+max_frames = 300
+
+
+def detect_faces(image):
+    return DeepFace.extract_faces(
+        img_path=image,
+        detector_backend='retinaface',
+        enforce_detection=False
+    )
+
+
+def detect_full_frame(frame):
+    faces = []
+    for face in detect_faces(cv2.resize(frame, (640, 480))):
+        # Descarta o frame inteiro que o DeepFace devolve quando não acha face
+        if face.get('confidence', 0) == 0:
+            continue
+        face_image_rgb = face["face"]
+        if face_image_rgb.size == 0:
+            continue
+        if face_image_rgb.dtype != 'uint8':
+            face_image_rgb = (face_image_rgb * 255).astype('uint8') if face_image_rgb.max() <= 1.0 else face_image_rgb.astype('uint8')
+        faces.append({'face': cv2.cvtColor(face_image_rgb, cv2.COLOR_RGB2BGR), 'facial_area': face["facial_area"]})
+    return faces
+
+
+def recognized(faces, templates, template_names):
+    for face in faces:
+        embedding = DeepFace.represent(
+            img_path=face['face'],
+            model_name='ArcFace',
+            detector_backend='skip',
+            enforce_detection=False
+        )
+        if not embedding:
+            continue
+        embedding_vector = np.array(embedding[0]["embedding"])
+        embedding_vector = embedding_vector / np.linalg.norm(embedding_vector)
+        index, distance = nearest(embedding_vector, templates)
+        if index is not None and distance < threshold:
+            return template_names[index]
+    return None
+
+
+def main():
+    with open(embeddings_file, 'rb') as f:
+        data = pickle.load(f)
+    templates, template_names = data.get('templates'), data.get('template_names')
+    if templates is None:
+        templates, template_names = build_templates(data['embeddings'], data['names'], verbose=False)
+
+    regions = load_regions()
+    resolution = AdaptiveResolution()
+    paths = {
+        'frame inteiro': detect_full_frame,
+        'ROI adaptativa': lambda frame: detect_faces_roi(frame, detect_faces, regions, resolution),
+    }
+    detection_times = {name: [] for name in paths}
+    detections = {name: 0 for name in paths}
+    recognitions = {name: 0 for name in paths}
+
+    video_capture = cv2.VideoCapture(video_path)
+    frames = 0
+    try:
+        while frames < max_frames:
+            ret, frame = video_capture.read()
+            if not ret:
+                break
+            frame = cv2.flip(frame, 1)
+            frames += 1
+
+            for name, detect in paths.items():
+                start = time.perf_counter()
+                faces = detect(frame)
+                detection_times[name].append(time.perf_counter() - start)
+                if faces:
+                    detections[name] += 1
+                    if recognized(faces, templates, template_names):
+                        recognitions[name] += 1
+    finally:
+        video_capture.release()
+
+    if frames == 0:
+        print("Nenhum frame lido.")
+        return
+
+    print(f"{frames} frame(s) avaliado(s) | largura final da ROI no detector: {resolution.width}px")
+    print(f"\n{'caminho':<16}{'detecção (ms)':>15}{'frames c/ face':>16}{'reconhecidos':>14}")
+    for name in paths:
+        detection_ms = 1000 * np.mean(detection_times[name])
+        detected = 100 * detections[name] / frames
+        recognition_rate = 100 * recognitions[name] / frames
+        print(f"{name:<16}{detection_ms:>15.1f}{detected:>15.1f}%{recognition_rate:>13.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import sys
+import time
+import pickle
+import numpy as np
+from templates import build_templates, nearest, normalize
+
+# Compara a galeria completa com os templates por pessoa (leave-one-out):
+# cada amostra cadastrada vira a face de teste e é removida da galeria.
+# O falso aceite simula um impostor: a mesma face contra a galeria sem a sua
+# própria pessoa, contando quantas vezes outra pessoa fica abaixo do limiar.
+embeddings_file = sys.argv[1] if len(sys.argv) > 1 else './dataset/authorized_embeddings.pkl'
+threshold = float(sys.argv[2]) if len(sys.argv) > 2 else 0.57
+
+
+def evaluate(probe, probe_name, gallery, gallery_names):
+    start = time.perf_counter()
+    index, distance = nearest(probe, gallery)
+    elapsed = time.perf_counter() - start
+    correct = index is not None and distance < threshold and gallery_names[index] == probe_name
+
+    impostors = [embedding for embedding, name in zip(gallery, gallery_names) if name != probe_name]
+    _, impostor_distance = nearest(probe, impostors)
+    if impostor_distance is None:
+        impostor_distance = np.inf
+    return correct, impostor_distance, elapsed
+
+
+def main():
+    with open(embeddings_file, 'rb') as f:
+        data = pickle.load(f)
+    embeddings = normalize(data['embeddings'])
+    names = list(data['names'])
+    print(f"{len(embeddings)} amostra(s) de {len(set(names))} pessoa(s) em {embeddings_file}")
+
+    results = {'galeria completa': [], 'templates': []}
+    gallery_sizes = {'galeria completa': [], 'templates': []}
+    for i in range(len(embeddings)):
+        rest = np.delete(embeddings, i, axis=0)
+        rest_names = names[:i] + names[i + 1:]
+        if names[i] not in rest_names:
+            continue
+
+        results['galeria completa'].append(evaluate(embeddings[i], names[i], rest, rest_names))
+        gallery_sizes['galeria completa'].append(len(rest))
+
+        templates, template_names = build_templates(rest, rest_names, verbose=False)
+        results['templates'].append(evaluate(embeddings[i], names[i], templates, template_names))
+        gallery_sizes['templates'].append(len(templates))
+
+    if not results['templates']:
+        print("São necessárias ao menos duas amostras por pessoa para a avaliação.")
+        return
+
+    if len(set(names)) < 2:
+        print("Com uma única pessoa cadastrada não é possível medir falso aceite.")
+
+    print(f"\nlimiar: {threshold}")
+    print(f"{'galeria':<18}{'tamanho':>10}{'acurácia':>12}{'falso aceite':>15}{'limiar s/ FA':>15}{'tempo/match (µs)':>20}")
+    for gallery_type, runs in results.items():
+        accuracy = 100 * np.mean([correct for correct, _, _ in runs])
+        impostor_distances = np.array([impostor_distance for _, impostor_distance, _ in runs])
+        false_accept = 100 * np.mean(impostor_distances < threshold)
+        # Maior limiar que ainda não aceitaria nenhum impostor neste conjunto
+        safe_threshold = impostor_distances.min()
+        match_time = 1e6 * np.mean([elapsed for _, _, elapsed in runs])
+        size = np.mean(gallery_sizes[gallery_type])
+        print(f"{gallery_type:<18}{size:>10.1f}{accuracy:>11.2f}%{false_accept:>14.2f}%{safe_threshold:>15.3f}{match_time:>20.2f}")
+
+
+if __name__ == '__main__':
+    main()
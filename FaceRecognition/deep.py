@@ -5,6 +5,8 @@ import numpy as np
 import time
 from threading import Thread
 from deepface import DeepFace
+from templates import build_templates, nearest
+from liveness import LivenessStage
 
 # Configuração do GPIO
 # GPIO.setmode(GPIO.BCM)
@@ -44,7 +46,6 @@ def load_authorized_faces(dataset_path, model_name='ArcFace'):
                         img_path=augmented_img,
                         model_name=model_name,
                         enforce_detection=True,
-                        anti_spoofing=True,
                         detector_backend='retinaface'
                     )
                     if embedding:
@@ -75,9 +76,11 @@ def augment_image(image):
 # Carregar embeddings das pessoas autorizadas
 authorized_embeddings, authorized_names = load_authorized_faces('dataset', model_name='ArcFace')
 
-# Função para calcular a distância coseno
-def cosine_distance(a, b):
-    return 1 - np.dot(a, b)
+# Agrupar as imagens (e cópias aumentadas) de cada pessoa em poucos centroides
+authorized_templates, authorized_template_names = build_templates(authorized_embeddings, authorized_names)
+
+# Anti-spoofing só para faces reconhecidas (sem rastreamento aqui, então sem cache)
+liveness_stage = LivenessStage(cache_ttl=0)
 
 # Função para processar a face detectada
 def process_face(frame):
@@ -122,8 +125,7 @@ def process_face(frame):
                 img_path=face_image_bgr,
                 model_name='ArcFace',
                 detector_backend='skip',
-                enforce_detection=True,
-                anti_spoofing=True
+                enforce_detection=True
             )
             if embedding:
                 embedding_vector = np.array(embedding[0]["embedding"])
@@ -132,28 +134,28 @@ def process_face(frame):
                 print("Não foi possível obter o embedding da face detectada")
                 continue
 
-            # Comparar com os embeddings autorizados
-            distances = []
-            for auth_embedding in authorized_embeddings:
-                distance = cosine_distance(auth_embedding, embedding_vector)
-                distances.append(distance)
-            distances = np.array(distances)
-
-            # Identificar a menor distância e verificar se está abaixo de um limiar
-            min_distance_index = np.argmin(distances)
-            min_distance = distances[min_distance_index]
+            # Comparar com os templates autorizados e obter a menor distância
+            min_distance_index, min_distance = nearest(embedding_vector, authorized_templates)
+            if min_distance_index is None:
+                print("Nenhum template autorizado carregado")
+                continue
             threshold = 0.5  # Ajuste conforme necessário após testes
 
             if min_distance < threshold:
-                authorized_person = authorized_names[min_distance_index]
-                confidence = max(0, min(100, (1 - min_distance) * 100))
-                display_text = f"Autorizado: {authorized_person} | Confiança: {confidence:.2f}%"
-                print(display_text)
-
-                # Acionar o GPIO para abrir a porta
-                # GPIO.output(18, GPIO.HIGH)
-                # time.sleep(5)  # Manter a porta aberta por 5 segundos
-                # GPIO.output(18, GPIO.LOW)
+                is_real = liveness_stage.check([(0, frame, face["facial_area"])])[0]
+                if not is_real:
+                    display_text = "Face falsa detectada"
+                    print(display_text)
+                else:
+                    authorized_person = authorized_template_names[min_distance_index]
+                    confidence = max(0, min(100, (1 - min_distance) * 100))
+                    display_text = f"Autorizado: {authorized_person} | Confiança: {confidence:.2f}%"
+                    print(display_text)
+
+                    # Acionar o GPIO para abrir a porta
+                    # GPIO.output(18, GPIO.HIGH)
+                    # time.sleep(5)  # Manter a porta aberta por 5 segundos
+                    # GPIO.output(18, GPIO.LOW)
             else:
                 confidence = max(0, min(100, (1 - min_distance) * 100))
                 display_text = f"Não autorizado | Confiança: {confidence:.2f}%"
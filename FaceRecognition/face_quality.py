@@ -0,0 +1,177 @@
+import time
+import cv2
+
+# Limiares de qualidade (ajuste conforme a câmera e a iluminação da porta)
+min_face_size = 60          # lado mínimo da face em pixels
+target_face_size = 160      # a partir deste tamanho o score de tamanho satura
+min_sharpness = 40.0        # variância do Laplaciano abaixo disso = face borrada
+target_sharpness = 300.0
+min_brightness = 50
+max_brightness = 210
+min_quality = 0.35          # score mínimo para a face ser candidata ao embedding
+
+# Pesos de cada critério no score final
+quality_weights = {
+    'size': 0.3,
+    'sharpness': 0.3,
+    'pose': 0.25,
+    'brightness': 0.15,
+}
+
+# Janela (em segundos) em que as faces de uma mesma pessoa são agrupadas
+track_window = 1.0
+track_iou = 0.3
+track_timeout = 2.0
+best_per_track = 1
+
+
+def _to_gray(face_image_bgr):
+    if face_image_bgr.ndim == 2:
+        return face_image_bgr
+    return cv2.cvtColor(face_image_bgr, cv2.COLOR_BGR2GRAY)
+
+
+def size_score(facial_area):
+    side = min(facial_area['w'], facial_area['h'])
+    if side < min_face_size:
+        return 0.0
+    return float(min(1.0, side / target_face_size))
+
+
+def sharpness_score(gray):
+    sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+    if sharpness < min_sharpness:
+        return 0.0
+    return float(min(1.0, sharpness / target_sharpness))
+
+
+def brightness_score(gray):
+    brightness = gray.mean()
+    if brightness < min_brightness or brightness > max_brightness:
+        return 0.0
+    # Score máximo no meio da faixa aceitável
+    center = (min_brightness + max_brightness) / 2
+    half_range = (max_brightness - min_brightness) / 2
+    return float(1.0 - abs(brightness - center) / half_range)
+
+
+# Estima o quão frontal está a face a partir da posição dos olhos na caixa
+def pose_score(facial_area):
+    left_eye = facial_area.get('left_eye')
+    right_eye = facial_area.get('right_eye')
+    if left_eye is None or right_eye is None:
+        return 0.5
+
+    x, y, w, h = facial_area['x'], facial_area['y'], facial_area['w'], facial_area['h']
+    if w == 0 or h == 0:
+        return 0.0
+
+    # Rotação no plano: olhos devem estar na mesma altura
+    dx = abs(left_eye[0] - right_eye[0])
+    dy = abs(left_eye[1] - right_eye[1])
+    if dx == 0:
+        return 0.0
+    roll = min(1.0, dy / dx)
+
+    # Rotação lateral: o ponto médio dos olhos deve estar no centro da caixa
+    eyes_center = (left_eye[0] + right_eye[0]) / 2
+    yaw = min(1.0, abs(eyes_center - (x + w / 2)) / (w / 2))
+
+    # Olhos muito próximos indicam face de perfil
+    eye_ratio = dx / w
+    profile = 0.0 if eye_ratio >= 0.3 else 1.0 - eye_ratio / 0.3
+
+    return float(max(0.0, 1.0 - max(roll, yaw, profile)))
+
+
+# Calcula o score de qualidade (0 a 1) de uma face recortada
+def face_quality(face_image_bgr, facial_area):
+    gray = _to_gray(face_image_bgr)
+    scores = {
+        'size': size_score(facial_area),
+        'sharpness': sharpness_score(gray),
+        'pose': pose_score(facial_area),
+        'brightness': brightness_score(gray),
+    }
+    # Qualquer critério reprovado descarta a face
+    if min(scores.values()) == 0.0:
+        return 0.0, scores
+    quality = sum(quality_weights[name] * score for name, score in scores.items())
+    return float(quality), scores
+
+
+def box_iou(a, b):
+    ax2, ay2 = a['x'] + a['w'], a['y'] + a['h']
+    bx2, by2 = b['x'] + b['w'], b['y'] + b['h']
+    inter_w = max(0, min(ax2, bx2) - max(a['x'], b['x']))
+    inter_h = max(0, min(ay2, by2) - max(a['y'], b['y']))
+    inter = inter_w * inter_h
+    union = a['w'] * a['h'] + b['w'] * b['h'] - inter
+    return inter / union if union > 0 else 0.0
+
+
+class FaceTrack:
+    def __init__(self, track_id, facial_area, now):
+        self.track_id = track_id
+        self.facial_area = facial_area
+        self.window_start = now
+        self.last_seen = now
+        self.candidates = []
+
+
+# Associa as faces entre frames (por IoU) e guarda as melhores faces de cada
+# pessoa dentro da janela; só as melhores vão para o embedding
+class BestFaceSelector:
+    def __init__(self, window=track_window, iou_threshold=track_iou,
+                 timeout=track_timeout, best_count=best_per_track, quality_threshold=min_quality):
+        self.window = window
+        self.iou_threshold = iou_threshold
+        self.timeout = timeout
+        self.best_count = best_count
+        self.quality_threshold = quality_threshold
+        self.tracks = {}
+        self.next_id = 0
+
+    def _match_track(self, facial_area):
+        best_track = None
+        best_iou = self.iou_threshold
+        for track in self.tracks.values():
+            iou = box_iou(track.facial_area, facial_area)
+            if iou >= best_iou:
+                best_track = track
+                best_iou = iou
+        return best_track
+
+    # `context` é guardado junto da face (ex.: recorte para o anti-spoofing)
+    def add(self, face_image_bgr, facial_area, now=None, context=None):
+        now = time.time() if now is None else now
+        track = self._match_track(facial_area)
+        if track is None:
+            track = FaceTrack(self.next_id, facial_area, now)
+            self.tracks[track.track_id] = track
+            self.next_id += 1
+        track.facial_area = facial_area
+        track.last_seen = now
+
+        quality, scores = face_quality(face_image_bgr, facial_area)
+        if quality >= self.quality_threshold:
+            track.candidates.append((quality, face_image_bgr, context))
+            track.candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+            del track.candidates[self.best_count:]
+        return track.track_id, quality, scores
+
+    # Retorna (track_id, face, qualidade, context) das faces cuja janela terminou
+    def pop_ready(self, now=None):
+        now = time.time() if now is None else now
+        ready = []
+        for track_id, track in list(self.tracks.items()):
+            if now - track.last_seen > self.timeout:
+                # Pessoa saiu da cena: ainda aproveita a melhor face coletada
+                ready.extend((track_id, face, quality, context) for quality, face, context in track.candidates)
+                del self.tracks[track_id]
+                continue
+            if now - track.window_start >= self.window and track.candidates:
+                ready.extend((track_id, face, quality, context) for quality, face, context in track.candidates)
+                track.candidates = []
+                track.window_start = now
+        return ready
@@ -0,0 +1,87 @@
+import os
+import time
+from deepface.modules import modeling
+
+# Anti-spoofing como etapa separada: só roda em faces ao vivo que já passaram
+# pela qualidade e pelo match, uma vez por face rastreada (LIVENESS=0 desativa)
+liveness_enabled = os.environ.get('LIVENESS', '1') != '0'
+liveness_cache_ttl = 10.0   # segundos que o resultado de uma face rastreada é reaproveitado
+
+# O FasNet usa recortes de 2.7x e 4.0x em volta da face; guardar essa região do
+# frame basta para avaliar a face depois sem manter o frame inteiro
+context_scale = 4.0
+
+
+# Recorta do frame a região de contexto usada pelo FasNet e devolve a caixa da
+# face nas coordenadas desse recorte
+def liveness_context(frame, facial_area, scale=context_scale):
+    frame_h, frame_w = frame.shape[:2]
+    x, y, w, h = facial_area['x'], facial_area['y'], facial_area['w'], facial_area['h']
+    cx, cy = x + w / 2, y + h / 2
+    half_w, half_h = w * scale / 2, h * scale / 2
+    x1, y1 = max(0, int(cx - half_w)), max(0, int(cy - half_h))
+    x2, y2 = min(frame_w, int(cx + half_w)), min(frame_h, int(cy + half_h))
+    patch = frame[y1:y2, x1:x2].copy()
+    return patch, {'x': x - x1, 'y': y - y1, 'w': w, 'h': h}
+
+
+# Avalia uma lista de (imagem BGR, facial_area) e retorna uma lista de booleanos.
+# A imagem precisa ter o contexto em volta da face (frame ou liveness_context).
+def deepface_predict_batch(items):
+    antispoof_model = modeling.build_model(task="spoofing", model_name="Fasnet")
+    results = []
+    for image, facial_area in items:
+        try:
+            is_real, score = antispoof_model.analyze(
+                img=image,
+                facial_area=(facial_area['x'], facial_area['y'], facial_area['w'], facial_area['h'])
+            )
+            results.append(bool(is_real))
+        except Exception as e:
+            print(f"Erro na verificação de vivacidade: {e}")
+            results.append(False)
+    return results
+
+
+# O FasNet do DeepFace não tem chamada em lote (uma passada por face);
+# a economia vem do cache por face rastreada
+class LivenessStage:
+    def __init__(self, predict_batch=deepface_predict_batch, enabled=liveness_enabled,
+                 batch_size=None, cache_ttl=liveness_cache_ttl):
+        self.predict_batch = predict_batch
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.cache_ttl = cache_ttl
+        self.cache = {}
+
+    # Recebe (chave, imagem, facial_area) e retorna {chave: é_real}.
+    # Com cache_ttl <= 0 nada é reaproveitado.
+    def check(self, items, now=None):
+        if not self.enabled:
+            return {key: True for key, _, _ in items}
+
+        now = time.time() if now is None else now
+        results = {}
+        pending = []
+        for key, image, facial_area in items:
+            cached = self.cache.get(key)
+            if cached is not None and now - cached[1] <= self.cache_ttl:
+                results[key] = cached[0]
+            else:
+                pending.append((key, image, facial_area))
+
+        batch_size = self.batch_size or max(1, len(pending))
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            predictions = self.predict_batch([(image, facial_area) for _, image, facial_area in batch])
+            for (key, _, _), is_real in zip(batch, predictions):
+                results[key] = is_real
+                if self.cache_ttl > 0:
+                    self.cache[key] = (is_real, now)
+        return results
+
+    # Descarta o resultado de faces que não estão mais sendo rastreadas
+    def forget(self, active_keys):
+        for key in list(self.cache):
+            if key not in active_keys:
+                del self.cache[key]
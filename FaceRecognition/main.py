@@ -1,7 +1,12 @@
 import os
-import shutil
 import cv2
 import time
+import uuid
+import base64
+import hashlib
+import mimetypes
+from threading import Lock
+import numpy as np
 import firebase_admin
 from google.cloud import storage
 
@@ -10,6 +15,7 @@ from ultralytics import YOLO
 from deepface import DeepFace
 from firebase_admin import credentials, storage
 from flask_cors import CORS
+from liveness import LivenessStage
 
 cred = credentials.Certificate("serviceAccountKey.json")
 firebase_admin.initialize_app(cred, {
@@ -21,6 +27,20 @@ model = YOLO('yolov8n-face.pt')
 app = Flask(__name__)
 CORS(app)
 
+# Cache local das imagens do Storage (mantido entre requisições e usado pelo survillence.py).
+# As requisições não gravam nem apagam nada fora dele; as imagens enviadas são tratadas em memória.
+sync_dataset_dir = "./dataset"
+sync_tmp_dir = "./.sync_tmp"
+# Geração do blob de cada arquivo do cache, para saber quando uma foto foi substituída
+cached_generations = {}
+# Arquivos baixados desde o início da sincronização atual (inclusive por requisições),
+# que a limpeza do cache não pode apagar mesmo que não estejam na listagem
+downloads_lock = Lock()
+recent_downloads = set()
+
+# Anti-spoofing roda uma vez por requisição, só quando a face já foi verificada
+liveness_stage = LivenessStage(cache_ttl=0)
+
 @app.route('/')
 def hello_world():
   return "Hello World!"
@@ -36,14 +56,10 @@ def detect_face():
 
   try:
     if uploaded_image and username:
-      user_directory = f"./dataset/{username}"
-      if not os.path.exists(user_directory):
-        os.makedirs(user_directory)
+      image_bytes = uploaded_image.read()
+      content_type = mimetypes.guess_type(uploaded_image.filename)[0] or uploaded_image.mimetype
 
-      image_path = os.path.join(user_directory, uploaded_image.filename)
-      uploaded_image.save(image_path)
-
-      result = process_image(image_path, username)
+      result = process_image(image_bytes, uploaded_image.filename, content_type, username)
 
       print(result)
 
@@ -59,8 +75,6 @@ def detect_face():
   except Exception as e:
     print(f"Error comparing images: {e}")
     return jsonify({"verified": False, "error": str(e)}), 500
-  finally:
-    shutil.rmtree("./dataset", ignore_errors=True)
 
 @app.route('/delete_image', methods=['POST'])
 def delete_image():
@@ -83,6 +97,7 @@ def delete_image():
         print(f'blob {blob}')
         if blob.exists():
             blob.delete()
+            remove_from_cache(blob_path)
             print(f"Imagem {image_name} deletada com sucesso do usuário {username}.")
             return jsonify({"message": f"Image {image_name} deleted successfully."}), 200
         else:
@@ -94,12 +109,15 @@ def delete_image():
         return jsonify({"error": str(e)}), 500
 
 
-def process_image(image_path, username):
+def decode_image(image_bytes):
+  return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+def process_image(image_bytes, filename, content_type, username):
   model.classes = [0]
 
-  image = cv2.imread(image_path)
+  image = decode_image(image_bytes)
   if image is None:
-    raise FileNotFoundError(f"Não foi possível encontrar ou abrir a imagem: {image_path}")
+    raise ValueError(f"Não foi possível abrir a imagem: {filename}")
 
   results = model.predict(image, conf=0.5)
 
@@ -107,16 +125,16 @@ def process_image(image_path, username):
 
   if total_faces > 0:
     print(f"{total_faces} face(s) detectada(s) na imagem.")
-    upload = upload_to_firebase(image_path, username)
+    upload = upload_to_firebase(image_bytes, filename, content_type, username)
     return 200
   else:
     return 400
 
-def upload_to_firebase(file_path, username):
+def upload_to_firebase(image_bytes, filename, content_type, username):
   bucket = storage.bucket()
-  blob = bucket.blob(f"{username}/{os.path.basename(file_path)}")
-  blob.upload_from_filename(file_path)
-  return f"File {file_path} uploaded to Firebase."
+  blob = bucket.blob(f"{username}/{os.path.basename(filename)}")
+  blob.upload_from_string(image_bytes, content_type=content_type)
+  return f"File {filename} uploaded to Firebase."
 
 @app.route('/verify_access', methods=['POST'])
 def verify_access():
@@ -125,12 +143,11 @@ def verify_access():
 
   try:
     if uploaded_image and username:
-      image_path = os.path.join('./uploaded_images', uploaded_image.filename)
-      if not os.path.exists('./uploaded_images'):
-        os.makedirs('./uploaded_images')
-      uploaded_image.save(image_path)
+      image = decode_image(uploaded_image.read())
+      if image is None:
+        return jsonify({"error": "Invalid image"}), 400
 
-      comparison_result = compare_with_processed_images(image_path, username)
+      comparison_result = compare_with_processed_images(image, username)
 
       return jsonify(comparison_result), 200
     else:
@@ -140,30 +157,29 @@ def verify_access():
     print(f"Error comparing images: {e}")
     return jsonify({"verified": False, "error": str(e)}), 500
 
-def compare_with_processed_images(image_path, username):
+def compare_with_processed_images(image, username):
   bucket = storage.bucket()
   blobs = bucket.list_blobs(prefix=f"{username}/")
 
-  temp_user_directory = f"./temp_dir/{username}/"
-
-  if not os.path.exists(temp_user_directory):
-    os.makedirs(temp_user_directory)
-
-  for blob in blobs:
-    temp_image_path = os.path.join(temp_user_directory, blob.name.split('/')[-1])
-    blob.download_to_filename(temp_image_path)
-
   try:
-    first_image = os.listdir(temp_user_directory)[0]
+    # Usa o cache sincronizado; só baixa as imagens que ainda não estão nele
+    reference_images = [download_to_cache(blob) for blob in blobs]
+    if not reference_images:
+      raise FileNotFoundError(f"Nenhuma imagem cadastrada para {username}")
+
     results = DeepFace.verify(
-      img1_path=image_path,
-      img2_path=os.path.join(temp_user_directory, first_image),
+      img1_path=image,
+      img2_path=reference_images[0],
       detector_backend="dlib",
       model_name="Dlib"
     )
 
     if results['verified']:
-      return {"verified": True, "distance": results['distance']}
+      # O FasNet recebe a imagem inteira para montar o próprio contexto em volta da face
+      if not liveness_stage.check([(0, image, results['facial_areas']['img1'])])[0]:
+        print(f"Face falsa detectada para {username}")
+        return {"verified": False, "distance": results['distance'], "live": False}
+      return {"verified": True, "distance": results['distance'], "live": True}
     else:
       return {"verified": False, "distance": results['distance']}
 
@@ -171,29 +187,83 @@ def compare_with_processed_images(image_path, username):
     print(f"Error comparing images: {e}")
     return {"verified": False, "error": str(e)}
 
+# Baixa o blob para o cache sem deixar arquivos parciais visíveis: o download vai
+# para um arquivo temporário único e só então é movido (os.replace é atômico)
+def download_to_cache(blob):
+  local_file_path = os.path.join(sync_dataset_dir, blob.name)
+  if os.path.exists(local_file_path) and is_cache_fresh(blob, local_file_path):
+    return local_file_path
+
+  os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+  os.makedirs(sync_tmp_dir, exist_ok=True)
+  temp_file_path = os.path.join(sync_tmp_dir, f"{uuid.uuid4().hex}{os.path.splitext(blob.name)[1]}")
+  try:
+    print(f"Baixando imagem: {blob.name} para {local_file_path}")
+    blob.download_to_filename(temp_file_path)
+    with downloads_lock:
+      os.replace(temp_file_path, local_file_path)
+      recent_downloads.add(os.path.normpath(local_file_path))
+    cached_generations[local_file_path] = blob.generation
   finally:
-    shutil.rmtree('./uploaded_images', ignore_errors=True)
-    shutil.rmtree('./temp_dir', ignore_errors=True)
+    if os.path.exists(temp_file_path):
+      os.remove(temp_file_path)
+  return local_file_path
+
+# O arquivo local só vale se corresponder à versão atual do blob (mesma geração ou mesmo MD5)
+def is_cache_fresh(blob, local_file_path):
+  if blob.generation is not None and cached_generations.get(local_file_path) == blob.generation:
+    return True
+  if blob.md5_hash is None:
+    return blob.generation is None
+
+  with open(local_file_path, 'rb') as f:
+    local_md5 = base64.b64encode(hashlib.md5(f.read()).digest()).decode()
+  if local_md5 != blob.md5_hash:
+    return False
+  cached_generations[local_file_path] = blob.generation
+  return True
+
+def remove_from_cache(blob_name):
+  local_file_path = os.path.join(sync_dataset_dir, blob_name)
+  cached_generations.pop(local_file_path, None)
+  if os.path.exists(local_file_path):
+    os.remove(local_file_path)
+    print(f"Imagem removida do cache: {local_file_path}")
 
 def sync_images_from_storage():
     bucket = storage.bucket()
+    with downloads_lock:
+        recent_downloads.clear()
     blobs = bucket.list_blobs()
 
-    local_dataset_dir = "./dataset"
-    if not os.path.exists(local_dataset_dir):
-        os.makedirs(local_dataset_dir)
+    if not os.path.exists(sync_dataset_dir):
+        os.makedirs(sync_dataset_dir)
 
+    synced_files = set()
     for blob in blobs:
         if blob.content_type and blob.content_type.startswith("image/"):
-            local_file_path = os.path.join(local_dataset_dir, blob.name)
-
-            os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
-
-            if not os.path.exists(local_file_path):
-                print(f"Baixando imagem: {blob.name} para {local_file_path}")
-                blob.download_to_filename(local_file_path)
-            else:
-                print(f"Imagem {blob.name} já existe no local. Ignorando download.")
+            synced_files.add(os.path.normpath(download_to_cache(blob)))
+
+    prune_cache(synced_files)
+
+# Remove do cache as imagens que não existem mais no Storage. Só olha as pastas
+# dos usuários (o authorized_embeddings.pkl fica na raiz) e mantém as pastas,
+# mesmo vazias, porque uma requisição pode estar baixando para elas.
+def prune_cache(synced_files):
+    for person_name in os.listdir(sync_dataset_dir):
+        person_dir = os.path.join(sync_dataset_dir, person_name)
+        if not os.path.isdir(person_dir):
+            continue
+        for image_name in os.listdir(person_dir):
+            local_file_path = os.path.normpath(os.path.join(person_dir, image_name))
+            if not os.path.isfile(local_file_path) or local_file_path in synced_files:
+                continue
+            with downloads_lock:
+                if local_file_path in recent_downloads:
+                    continue
+                os.remove(local_file_path)
+            cached_generations.pop(os.path.join(person_dir, image_name), None)
+            print(f"Imagem removida do Storage, apagando do cache: {local_file_path}")
 
 def start_sync_process(interval=60):
   while True:
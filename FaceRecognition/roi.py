@@ -0,0 +1,152 @@
+import os
+import cv2
+import numpy as np
+
+# Regiões de interesse em frações do frame (x, y, largura, altura).
+# Pode ser sobrescrito pela variável de ambiente ROI, ex.: "0.25,0,0.5,1;0,0,0.2,0.5"
+default_regions = [(0.2, 0.0, 0.6, 1.0)]
+
+# Resolução adaptativa: largura da ROI entregue ao detector
+min_detection_width = 256
+max_detection_width = 960
+initial_detection_width = 480
+detection_step = 1.25
+small_face = 48             # face menor que isso no detector -> aumenta a resolução
+large_face = 128            # face maior que isso no detector -> reduz a resolução
+crop_margin = 0.0           # mesmo enquadramento justo do cadastro (RetinaFace sem expansão)
+
+
+def parse_regions(value):
+    regions = []
+    for region in value.split(';'):
+        if not region.strip():
+            continue
+        x, y, w, h = (float(v) for v in region.split(','))
+        regions.append((x, y, w, h))
+    return regions
+
+
+def load_regions():
+    value = os.environ.get('ROI')
+    if value:
+        try:
+            return parse_regions(value)
+        except ValueError as e:
+            print(f"ROI inválida ({value}): {e}. Usando região padrão.")
+    return list(default_regions)
+
+
+# Converte a região em frações para pixels do frame
+def region_to_pixels(region, frame_shape):
+    frame_h, frame_w = frame_shape[:2]
+    x, y, w, h = region
+    x1 = int(max(0.0, x) * frame_w)
+    y1 = int(max(0.0, y) * frame_h)
+    x2 = int(min(1.0, x + w) * frame_w)
+    y2 = int(min(1.0, y + h) * frame_h)
+    return x1, y1, x2, y2
+
+
+# Ajusta a resolução de detecção conforme o tamanho das faces encontradas
+class AdaptiveResolution:
+    def __init__(self, width=initial_detection_width, min_width=min_detection_width,
+                 max_width=max_detection_width, step=detection_step):
+        self.width = width
+        self.min_width = min_width
+        self.max_width = max_width
+        self.step = step
+
+    def scale_for(self, roi_width):
+        return min(1.0, self.width / roi_width)
+
+    def update(self, face_sizes):
+        if not face_sizes:
+            return
+        smallest = min(face_sizes)
+        if smallest < small_face:
+            self.width = min(self.max_width, int(self.width * self.step))
+        elif smallest > large_face:
+            self.width = max(self.min_width, int(self.width / self.step))
+
+
+# Converte uma caixa detectada na ROI reduzida para coordenadas do frame original
+def map_to_frame(facial_area, offset_x, offset_y, scale):
+    mapped = {
+        'x': int(offset_x + facial_area['x'] / scale),
+        'y': int(offset_y + facial_area['y'] / scale),
+        'w': int(facial_area['w'] / scale),
+        'h': int(facial_area['h'] / scale),
+    }
+    for eye in ('left_eye', 'right_eye'):
+        point = facial_area.get(eye)
+        if point is not None:
+            mapped[eye] = (int(offset_x + point[0] / scale), int(offset_y + point[1] / scale))
+    return mapped
+
+
+# Recorta a face do frame em resolução total, alinhando pelos olhos quando possível
+def crop_face(frame, facial_area, margin=crop_margin):
+    frame_h, frame_w = frame.shape[:2]
+    x, y, w, h = facial_area['x'], facial_area['y'], facial_area['w'], facial_area['h']
+    left_eye = facial_area.get('left_eye')
+    right_eye = facial_area.get('right_eye')
+    mx, my = int(w * margin), int(h * margin)
+
+    if left_eye is not None and right_eye is not None:
+        angle = np.degrees(np.arctan2(left_eye[1] - right_eye[1], left_eye[0] - right_eye[0]))
+        if abs(angle) > 90:
+            angle -= 180 * np.sign(angle)
+
+        # Rotaciona só um recorte com folga para a caixa girada, não o frame inteiro
+        cx, cy = x + w / 2, y + h / 2
+        half = int(np.ceil(np.hypot(w + 2 * mx, h + 2 * my) / 2))
+        px1, py1 = max(0, int(cx) - half), max(0, int(cy) - half)
+        px2, py2 = min(frame_w, int(cx) + half), min(frame_h, int(cy) + half)
+        patch = frame[py1:py2, px1:px2]
+        M = cv2.getRotationMatrix2D((cx - px1, cy - py1), angle, 1)
+        frame = cv2.warpAffine(patch, M, (patch.shape[1], patch.shape[0]))
+        x, y = x - px1, y - py1
+        frame_h, frame_w = frame.shape[:2]
+
+    x1, y1 = max(0, x - mx), max(0, y - my)
+    x2, y2 = min(frame_w, x + w + mx), min(frame_h, y + h + my)
+    return frame[y1:y2, x1:x2]
+
+
+# Executa o detector apenas nas ROIs reduzidas e devolve as faces recortadas do
+# frame original. `detect` recebe uma imagem BGR e devolve a lista do
+# DeepFace.extract_faces.
+def detect_faces_roi(frame, detect, regions, resolution):
+    faces = []
+    face_sizes = []
+    for region in regions:
+        x1, y1, x2, y2 = region_to_pixels(region, frame.shape)
+        if x2 <= x1 or y2 <= y1:
+            continue
+        roi = frame[y1:y2, x1:x2]
+        scale = resolution.scale_for(roi.shape[1])
+        if scale < 1.0:
+            roi = cv2.resize(roi, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        for face in detect(roi):
+            # Sem face real o DeepFace devolve a ROI inteira com confiança 0
+            if face.get('confidence', 0) == 0:
+                continue
+            area = face['facial_area']
+            if area['w'] == 0 or area['h'] == 0:
+                continue
+            face_sizes.append(min(area['w'], area['h']))
+            facial_area = map_to_frame(area, x1, y1, scale)
+            face_image_bgr = crop_face(frame, facial_area)
+            if face_image_bgr.size == 0:
+                continue
+            faces.append({'face': face_image_bgr, 'facial_area': facial_area, 'confidence': face.get('confidence', 0)})
+
+    resolution.update(face_sizes)
+    return faces
+
+
+def draw_regions(frame, regions, color=(255, 0, 0)):
+    for region in regions:
+        x1, y1, x2, y2 = region_to_pixels(region, frame.shape)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 1)
@@ -8,6 +8,10 @@ import requests
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from datetime import datetime
+from face_quality import BestFaceSelector
+from templates import build_templates, nearest
+from roi import AdaptiveResolution, detect_faces_roi, draw_regions, load_regions
+from liveness import LivenessStage, liveness_context
 
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
 
@@ -17,6 +21,15 @@ display_text = "Aguardando detecção..."
 processing_lock = Lock()
 embeddings_lock = Lock()
 threshold = 0.57
+face_selector = BestFaceSelector()
+
+# Detecção apenas nas regiões de interesse, em resolução adaptativa (USE_ROI=0 volta ao frame inteiro)
+use_roi = os.environ.get('USE_ROI', '1') != '0'
+regions = load_regions()
+detection_resolution = AdaptiveResolution()
+
+# Anti-spoofing só nas faces já reconhecidas, uma vez por face rastreada
+liveness_stage = LivenessStage()
 
 video_capture = cv2.VideoCapture(0)
 
@@ -52,22 +65,32 @@ def load_authorized_faces(dataset_path, model_name='ArcFace'):
     print(f"Total de embeddings carregados: {len(authorized_embeddings)}")
     return authorized_embeddings, authorized_names
 
-def save_embeddings(embeddings, names, filename):
+# As amostras brutas ficam salvas junto dos templates para permitir reconstruí-los
+def save_embeddings(embeddings, names, templates, template_names, filename):
     with open(filename, 'wb') as f:
-        pickle.dump({'embeddings': embeddings, 'names': names}, f)
+        pickle.dump({
+            'embeddings': embeddings,
+            'names': names,
+            'templates': templates,
+            'template_names': template_names
+        }, f)
     print(f"Embeddings salvos em {filename}")
 
 def load_embeddings(filename):
     with open(filename, 'rb') as f:
         data = pickle.load(f)
     print(f"Embeddings carregados de {filename}")
-    return data['embeddings'], data['names']
+    if 'templates' not in data:
+        data['templates'], data['template_names'] = build_templates(data['embeddings'], data['names'])
+    return data['embeddings'], data['names'], data['templates'], data['template_names']
 
 def update_embeddings():
-    global authorized_embeddings, authorized_names
+    global authorized_embeddings, authorized_names, authorized_templates, authorized_template_names
     with embeddings_lock:
         authorized_embeddings, authorized_names = load_authorized_faces('./dataset', model_name='ArcFace')
-        save_embeddings(authorized_embeddings, authorized_names, embeddings_file)
+        authorized_templates, authorized_template_names = build_templates(authorized_embeddings, authorized_names)
+        save_embeddings(authorized_embeddings, authorized_names,
+                        authorized_templates, authorized_template_names, embeddings_file)
     print("Embeddings atualizados.")
 
 class DatasetEventHandler(FileSystemEventHandler):
@@ -86,15 +109,54 @@ def start_observer():
     return observer
 
 if os.path.exists(embeddings_file):
-    authorized_embeddings, authorized_names = load_embeddings(embeddings_file)
+    authorized_embeddings, authorized_names, authorized_templates, authorized_template_names = load_embeddings(embeddings_file)
 else:
     authorized_embeddings, authorized_names = load_authorized_faces('./dataset', model_name='ArcFace')
-    save_embeddings(authorized_embeddings, authorized_names, embeddings_file)
+    authorized_templates, authorized_template_names = build_templates(authorized_embeddings, authorized_names)
+    save_embeddings(authorized_embeddings, authorized_names,
+                    authorized_templates, authorized_template_names, embeddings_file)
 
 observer = start_observer()
 
-def cosine_distance(a, b):
-    return 1 - np.dot(a, b)
+def detect_faces(image):
+    return DeepFace.extract_faces(
+        img_path=image,
+        detector_backend='retinaface',
+        enforce_detection=False
+    )
+
+# Caminho antigo: frame inteiro reduzido para 640x480 e face recortada pelo RetinaFace.
+# A caixa volta para as coordenadas do frame original (usadas pelo anti-spoofing).
+def detect_faces_full_frame(frame):
+    faces = []
+    scale_x, scale_y = frame.shape[1] / 640, frame.shape[0] / 480
+    for face in detect_faces(cv2.resize(frame, (640, 480))):
+        # Sem face real o DeepFace devolve a imagem inteira com confiança 0
+        if face["confidence"] == 0:
+            continue
+
+        face_image_rgb = face["face"]
+        if face_image_rgb.size == 0:
+            print("Face detectada inválida")
+            continue
+
+        if face_image_rgb.dtype != 'uint8':
+            if face_image_rgb.max() <= 1.0:
+                face_image_rgb = (face_image_rgb * 255).astype('uint8')
+            else:
+                face_image_rgb = face_image_rgb.astype('uint8')
+
+        face_image_bgr = cv2.cvtColor(face_image_rgb, cv2.COLOR_RGB2BGR)
+        area = face["facial_area"]
+        facial_area = {
+            'x': int(area['x'] * scale_x), 'y': int(area['y'] * scale_y),
+            'w': int(area['w'] * scale_x), 'h': int(area['h'] * scale_y)
+        }
+        for eye in ('left_eye', 'right_eye'):
+            if area.get(eye) is not None:
+                facial_area[eye] = (int(area[eye][0] * scale_x), int(area[eye][1] * scale_y))
+        faces.append({'face': face_image_bgr, 'facial_area': facial_area, 'confidence': face["confidence"]})
+    return faces
 
 def process_face(frame):
     global processing, authorized_person, display_text
@@ -103,94 +165,111 @@ def process_face(frame):
         processing = True
 
     try:
-        faces = DeepFace.extract_faces(
-            img_path=frame,
-            detector_backend='retinaface',
-            enforce_detection=False
-        )
-
-        if not faces:
+        if use_roi:
+            faces = detect_faces_roi(frame, detect_faces, regions, detection_resolution)
+        else:
+            faces = detect_faces_full_frame(frame)
+
+        if faces:
+            print(f"Número de faces detectadas: {len(faces)}")
+        else:
             print("Nenhuma face detectada")
             display_text = "Nenhuma face detectada"
-            return
-
-        print(f"Número de faces detectadas: {len(faces)}")
 
         for face in faces:
-            face_image_rgb = face["face"]
-            if face_image_rgb.size == 0:
-                print("Face detectada inválida")
+            # Guarda o contexto em volta da face para o FasNet, caso ela seja a escolhida
+            context = liveness_context(frame, face["facial_area"]) if liveness_stage.enabled else None
+            track_id, quality, scores = face_selector.add(face["face"], face["facial_area"], context=context)
+            if quality < face_selector.quality_threshold:
+                print(f"Face {track_id} descartada pela qualidade: {scores}")
+
+        # Só as melhores faces de cada pessoa na janela passam pelo ArcFace.
+        # As candidatas vêm da melhor para a pior; basta um match por pessoa.
+        matches = []
+        matched_tracks = set()
+        for track_id, face_image_bgr, quality, context in face_selector.pop_ready():
+            if track_id in matched_tracks:
                 continue
-
-            if face_image_rgb.dtype != 'uint8':
-                if face_image_rgb.max() <= 1.0:
-                    face_image_rgb = (face_image_rgb * 255).astype('uint8')
+            print(f"Processando melhor face de {track_id} (qualidade: {quality:.2f})")
+            match = recognize_face(face_image_bgr)
+            if match is not None:
+                matched_tracks.add(track_id)
+                matches.append((track_id, face_image_bgr, context) + match)
+
+        liveness_stage.forget(face_selector.tracks.keys())
+        if matches:
+            liveness = liveness_stage.check([
+                (track_id, context[0], context[1]) if context is not None else (track_id, None, None)
+                for track_id, _, context, _, _ in matches
+            ])
+            for track_id, face_image_bgr, _, person_name, confidence in matches:
+                if liveness[track_id]:
+                    grant_access(face_image_bgr, person_name, confidence)
                 else:
-                    face_image_rgb = face_image_rgb.astype('uint8')
-
-            face_image_bgr = cv2.cvtColor(face_image_rgb, cv2.COLOR_RGB2BGR)
-            face_image_bgr = cv2.resize(face_image_bgr, (160, 160))
-            
-            embedding = DeepFace.represent(
-                img_path=face_image_bgr,
-                model_name='ArcFace',
-                detector_backend='retinaface',
-                enforce_detection=False
-            )
-            if embedding:
-                embedding_vector = np.array(embedding[0]["embedding"])
-                embedding_vector = embedding_vector / np.linalg.norm(embedding_vector)
-                print(f"Embedding da face detectada (norma: {np.linalg.norm(embedding_vector):.4f})")
-            else:
-                print("Não foi possível obter o embedding da face detectada")
-                continue
+                    display_text = f"Face falsa detectada: {person_name}"
+                    print(display_text)
 
-            with embeddings_lock:
-                current_embeddings = authorized_embeddings.copy()
-                current_names = authorized_names.copy()
+    except Exception as e:
+        print(f"Erro durante o processamento da face: {e}")
+        display_text = "Erro no processamento"
+    finally:
+        with processing_lock:
+            processing = False
 
-            distances = []
-            for idx, auth_embedding in enumerate(current_embeddings):
-                distance = cosine_distance(auth_embedding, embedding_vector)
-                distances.append(distance)
+# Retorna (pessoa, confiança) se a face for autorizada, senão None
+def recognize_face(face_image_bgr):
+    global display_text
+
+    embedding = DeepFace.represent(
+        img_path=face_image_bgr,
+        model_name='ArcFace',
+        detector_backend='skip',
+        enforce_detection=False
+    )
+    if embedding:
+        embedding_vector = np.array(embedding[0]["embedding"])
+        embedding_vector = embedding_vector / np.linalg.norm(embedding_vector)
+        print(f"Embedding da face detectada (norma: {np.linalg.norm(embedding_vector):.4f})")
+    else:
+        print("Não foi possível obter o embedding da face detectada")
+        return None
+
+    # Compara com os centroides de cada pessoa em vez de todas as fotos cadastradas
+    with embeddings_lock:
+        current_templates = authorized_templates
+        current_names = authorized_template_names
 
-            distances = np.array(distances)
+    min_distance_index, min_distance = nearest(embedding_vector, current_templates)
 
-            if distances.size > 0:
-                min_distance_index = np.argmin(distances)
-                min_distance = distances[min_distance_index]
+    if min_distance_index is not None:
+        confidence = max(0, min(100, (1 - (min_distance / threshold)) * 100))
+        if min_distance < threshold:
+            return current_names[min_distance_index], confidence
+        display_text = f"Não autorizado | Confiança: {confidence:.2f}%"
+        print(display_text)
 
-                if min_distance < threshold:
-                    authorized_person = current_names[min_distance_index]
-                    confidence = max(0, min(100, (1 - (min_distance / threshold)) * 100))
-                    display_text = f"Autorizado: {authorized_person} | Confiança: {confidence:.2f}%"
-                    print(display_text)
+    else:
+        print("Nenhuma face correspondente encontrada.")
+        display_text = "Nenhuma face correspondente encontrada."
+    return None
 
-                    save_detected_face(face_image_bgr, authorized_person)
+def grant_access(face_image_bgr, person_name, confidence):
+    global authorized_person, display_text
 
-                    try:
-                        response = requests.post("http://localhost:5555/open")
-                        if response.status_code == 200:
-                            print("Requisição enviada com sucesso.")
-                        else:
-                            print(f"Falha na requisição. Status: {response.status_code}")
-                    except requests.exceptions.RequestException as e:
-                        print(f"Erro ao enviar requisição: {e}")
-                else:
-                    confidence = max(0, min(100, (1 - (min_distance / threshold)) * 100))
-                    display_text = f"Não autorizado | Confiança: {confidence:.2f}%"
-                    print(display_text)
+    authorized_person = person_name
+    display_text = f"Autorizado: {authorized_person} | Confiança: {confidence:.2f}%"
+    print(display_text)
 
-            else:
-                print("Nenhuma face correspondente encontrada.")
-                display_text = "Nenhuma face correspondente encontrada."
+    save_detected_face(face_image_bgr, authorized_person)
 
-    except Exception as e:
-        print(f"Erro durante o processamento da face: {e}")
-        display_text = "Erro no processamento"
-    finally:
-        with processing_lock:
-            processing = False
+    try:
+        response = requests.post("http://localhost:5555/open")
+        if response.status_code == 200:
+            print("Requisição enviada com sucesso.")
+        else:
+            print(f"Falha na requisição. Status: {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        print(f"Erro ao enviar requisição: {e}")
 
 def save_detected_face(face_image_bgr, person_name):
     save_dir = './entries'
@@ -217,9 +296,11 @@ try:
 
         with processing_lock:
             if not processing:
-                thread = Thread(target=process_face, args=(frame_resized,))
+                thread = Thread(target=process_face, args=(frame,))
                 thread.start()
 
+        if use_roi:
+            draw_regions(frame_resized, regions)
         cv2.putText(frame_resized, display_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
 
         cv2.imshow('Video', frame_resized)
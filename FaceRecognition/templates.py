@@ -0,0 +1,91 @@
+import numpy as np
+
+# Configuração dos templates por pessoa
+max_centroids = 3           # máximo de centroides por pessoa
+samples_per_centroid = 5    # amostras necessárias para abrir mais um centroide
+outlier_mad = 3.0           # desvios (MAD) acima da mediana para descartar a amostra
+kmeans_iterations = 20
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float64)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+# Remove as fotos de cadastro muito distantes das demais da mesma pessoa
+def reject_outliers(samples, mad_factor=outlier_mad):
+    if len(samples) < 3:
+        return samples, np.ones(len(samples), dtype=bool)
+
+    center = normalize(samples.mean(axis=0))
+    distances = 1 - samples @ center
+    median = np.median(distances)
+    mad = np.median(np.abs(distances - median))
+    if mad == 0:
+        return samples, np.ones(len(samples), dtype=bool)
+
+    keep = distances <= median + mad_factor * mad
+    return samples[keep], keep
+
+
+# k-means esférico (distância coseno) sobre embeddings normalizados
+def spherical_kmeans(samples, k, iterations=kmeans_iterations):
+    # Inicialização determinística: amostra mais distante das já escolhidas
+    centroids = [samples[0]]
+    for _ in range(1, k):
+        similarity = np.max(samples @ np.array(centroids).T, axis=1)
+        centroids.append(samples[np.argmin(similarity)])
+    centroids = np.array(centroids)
+
+    for _ in range(iterations):
+        labels = np.argmax(samples @ centroids.T, axis=1)
+        new_centroids = np.array([
+            normalize(samples[labels == i].mean(axis=0)) if np.any(labels == i) else centroids[i]
+            for i in range(k)
+        ])
+        if np.allclose(new_centroids, centroids):
+            break
+        centroids = new_centroids
+    return centroids
+
+
+# Agrupa os embeddings de cada pessoa em um ou poucos centroides
+def build_templates(embeddings, names, max_k=max_centroids, per_centroid=samples_per_centroid,
+                    mad_factor=outlier_mad, verbose=True):
+    template_embeddings = []
+    template_names = []
+    if len(embeddings) == 0:
+        return template_embeddings, template_names
+
+    embeddings = normalize(embeddings)
+    names = np.asarray(names)
+    for person_name in dict.fromkeys(names.tolist()):
+        samples = embeddings[names == person_name]
+        samples, keep = reject_outliers(samples, mad_factor)
+        rejected = int(np.sum(~keep))
+        if rejected and verbose:
+            print(f"{rejected} amostra(s) descartada(s) como outlier para {person_name}")
+
+        k = max(1, min(max_k, len(samples) // per_centroid))
+        if k == 1:
+            centroids = normalize(samples.mean(axis=0))[np.newaxis]
+        else:
+            centroids = spherical_kmeans(samples, k)
+
+        for centroid in centroids:
+            template_embeddings.append(centroid)
+            template_names.append(person_name)
+        if verbose:
+            print(f"Template de {person_name}: {len(samples)} amostra(s) -> {len(centroids)} centroide(s)")
+    return template_embeddings, template_names
+
+
+# Retorna o índice e a distância coseno do embedding mais próximo da galeria
+def nearest(embedding_vector, gallery):
+    if len(gallery) == 0:
+        return None, None
+    distances = 1 - np.asarray(gallery) @ embedding_vector
+    index = int(np.argmin(distances))
+    return index, float(distances[index])